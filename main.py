@@ -1,46 +1,148 @@
 import os
-import subprocess
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import ansible_runner
 from ruamel.yaml import YAML
 
 from src import CzechLightROADMConfig, create_inventory
 
-yaml = YAML()
+yaml = YAML(typ='safe', pure=False)
+
+log = logging.getLogger('roadm')
+
+
+def mitogen_strategy_plugins() -> str | None:
+    """Find the directory with the Mitogen strategy plugins.
+    Return None if Mitogen is not installed or does not support the installed Ansible version, in which case the
+    default Ansible strategy is used.
+    """
+
+    try:
+        # Importing the loaders runs the Ansible version check of Mitogen
+        import ansible_mitogen.loaders
+    except Exception as e:
+        log.debug(f'Mitogen is not available ({e}), using the default Ansible strategy')
+        return None
+
+    strategy_plugins = os.path.join(os.path.dirname(ansible_mitogen.loaders.__file__), 'plugins', 'strategy')
+    return strategy_plugins if os.path.isdir(strategy_plugins) else None
+
+
+def run_playbook(playbook: str, extra_vars: dict, device: dict, inventory_file: str,
+                 envvars: dict) -> tuple[int, str]:
+    """Run the Ansible playbook for a single device with ansible-runner, which still starts ansible-playbook as a child
+    process. Every run gets its own private data directory, because ansible-runner stores the extra variables there
+    and the runs would overwrite each other. The output of the playbook is captured, so that the outputs of the
+    playbooks running in parallel are not interleaved.
+
+    :param playbook: The path to the playbook.
+    :param extra_vars: The extra variables passed to the playbook.
+    :param device: The device configuration.
+    :param inventory_file: The path to the Ansible inventory file.
+    :param envvars: The environment variables set for the playbook in addition to the current environment.
+    :return: A tuple of the return code and the output of the playbook.
+    """
+
+    with tempfile.TemporaryDirectory(prefix=f"{device['name']}_") as private_data_dir:
+        runner = ansible_runner.run(private_data_dir=private_data_dir, playbook=playbook, inventory=inventory_file,
+                                    extravars=extra_vars, limit=device['name'], envvars=envvars, quiet=True)
+        with runner.stdout as f:
+            return runner.rc, f.read()
+
+
+def run_playbooks(playbook: str, jobs: list[tuple[dict, dict]], inventory_file: str,
+                  envvars: dict) -> list[int]:
+    """Run the Ansible playbook for multiple devices in parallel and log the output of each device as one message.
+
+    :param playbook: The path to the playbook.
+    :param jobs: The list of the device configurations and the extra variables passed to the playbook.
+    :param inventory_file: The path to the Ansible inventory file.
+    :param envvars: The environment variables set for the playbooks in addition to the current environment.
+    :return: The list of the return codes in the same order as the jobs. A run that raised an exception is reported
+             with the return code 1.
+    """
+
+    if not jobs:
+        return []
+
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        futures = [executor.submit(run_playbook, playbook, extra_vars, device, inventory_file, envvars)
+                   for device, extra_vars in jobs]
+
+        # A failure of one device must not affect the results of the other devices
+        results = []
+        for (device, _), future in zip(jobs, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                log.error(f"Running {playbook} for {device['name']} ({device['ip_address']}) failed: {e}")
+                results.append((1, None))
+
+    for (device, _), (_, output) in zip(jobs, results):
+        if output is not None:
+            log.info(f"Output of {playbook} for {device['name']} ({device['ip_address']}):\n{output.rstrip()}")
+
+    return [rc for rc, _ in results]
 
 
 def main():
-    print('\n==================================================')
-    print('\t CzechLight ROADM Configuration Script')
-    print('==================================================\n')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+    log.info('CzechLight ROADM Configuration Script')
 
-    # Set host_key_checking to False
-    d = dict(os.environ)
-    d['ANSIBLE_HOST_KEY_CHECKING'] = 'False'
+    cwd = os.getcwd()
+    data_dir = os.path.join(cwd, 'data')
+    backup_dir = os.path.join(cwd, 'backup')
+    checkup_dir = os.path.join(cwd, 'checkup')
+    config_dir = os.path.join(cwd, 'config')
+    playbooks_dir = os.path.join(cwd, 'playbooks')
 
     # Create necessary directories
-    os.makedirs('data', exist_ok=True)
-    os.makedirs('backup', exist_ok=True)
-    os.makedirs('checkup', exist_ok=True)
+    os.makedirs(data_dir, exist_ok=True)
+    os.makedirs(backup_dir, exist_ok=True)
+    os.makedirs(checkup_dir, exist_ok=True)
 
-    devices = yaml.load(open('config/devices.yaml', 'r').read())
-    inventory_file = os.path.join(os.getcwd(), 'playbooks', 'inventory.yaml')
-    create_inventory(devices, inventory_file)
+    with open(f'{config_dir}/devices.yaml', 'rb') as f:
+        devices = yaml.load(f)
 
-    for device in devices:
-        print(f"\nINFO: Processing device: {device['name']} ({device['ip_address']})")
+    # Use the project Ansible configuration (no fact gathering) unless the caller sets their own
+    # and set host_key_checking to False
+    d = {'ANSIBLE_CONFIG': os.environ.get('ANSIBLE_CONFIG', f'{playbooks_dir}/ansible.cfg'),
+         'ANSIBLE_HOST_KEY_CHECKING': 'False'}
 
-        final_config_file = os.path.join(os.getcwd(), 'data', f"{device['name']}.xml")
-        backup_path = os.path.join(os.getcwd(), 'backup', f"{device['name']}_backup.xml")
-        proposed_config_file = os.path.join(os.getcwd(), 'config', f"{device['name']}.yaml")
-        channel_plan_file = os.path.join(os.getcwd(), 'data', f"{device['name']}_channel_plan.xml")
-        media_channels_file = os.path.join(os.getcwd(), 'data', f"{device['name']}_media_channels.xml")
+    # Use the Mitogen strategy if it is installed and supports the installed Ansible version
+    strategy_plugins = mitogen_strategy_plugins()
+    if strategy_plugins is not None:
+        d['ANSIBLE_STRATEGY_PLUGINS'] = strategy_plugins
+        d['ANSIBLE_STRATEGY'] = 'mitogen_linear'
 
-        print(f'\t - INFO: Downloading current configuration from {device["ip_address"]}')
-        res = subprocess.run(['ansible-playbook', 'playbooks/get_config.yaml',
-                              '-e', f"channel_plan_file={channel_plan_file} media_channels_file={media_channels_file}",
-                              '--limit', device['name'], '-i', inventory_file], env=d)
+    inventory_file = f'{playbooks_dir}/inventory.yaml'
+    create_inventory(devices, inventory_file)
 
-        if res.returncode != 0:
-            print(f'\t - ERROR: Downloading configuration from {device["ip_address"]} failed')
+    # Download the current configuration from all devices in parallel
+    log.info(f'Downloading current configuration from {len(devices)} devices')
+    download_jobs = []
+    for device in devices:
+        channel_plan_file = f"{data_dir}/{device['name']}_channel_plan.xml"
+        media_channels_file = f"{data_dir}/{device['name']}_media_channels.xml"
+        download_jobs.append((device, {'channel_plan_file': channel_plan_file,
+                                       'media_channels_file': media_channels_file}))
+    download_results = run_playbooks(f'{playbooks_dir}/get_config.yaml', download_jobs, inventory_file, d)
+
+    # Validate and create the configuration of each device
+    upload_jobs = []
+    for device, rc in zip(devices, download_results):
+        log.info(f"Processing device: {device['name']} ({device['ip_address']})")
+
+        final_config_file = f"{data_dir}/{device['name']}.xml"
+        backup_file = f"{device['name']}_backup.xml"
+        proposed_config_file = f"{config_dir}/{device['name']}.yaml"
+        channel_plan_file = f"{data_dir}/{device['name']}_channel_plan.xml"
+        media_channels_file = f"{data_dir}/{device['name']}_media_channels.xml"
+
+        if rc != 0:
+            log.error(f'Downloading configuration from {device["ip_address"]} failed')
             continue
 
         device_config = CzechLightROADMConfig(channel_plan_file=channel_plan_file,
@@ -49,29 +151,32 @@ def main():
                                               mode=device['mode'])
 
         if device['validate']:
-            print(f'\t - INFO: Comparing current configuration with proposed configuration from:'
-                  f'\n\t\t{proposed_config_file}')
-            device_config.create_summary(os.path.join(os.getcwd(), 'checkup'))
-            print(f'\t - INFO: Comparison finished. Summary saved to {os.path.join(os.getcwd(), "checkup")}')
-            i = input(f'\t - QUESTION: Do you want to continue with the configuration of this device? [y/n]\n\t\t')
+            log.info(f'Comparing current configuration with proposed configuration from {proposed_config_file}')
+            device_config.create_summary(checkup_dir)
+            log.info(f'Comparison finished. Summary saved to {checkup_dir}')
+            i = input(f'Do you want to continue with the configuration of {device["name"]}? [y/n] ')
             if i.lower() != 'y':
-                print(f'\t - Skipping device {device["name"]}')
+                log.info(f'Skipping device {device["name"]}')
                 continue
         else:
-            print(f'\t - WARNING: Skipping validation of the configuration')
+            log.warning(f'Skipping validation of the configuration of {device["name"]}')
 
         device_config.create_config(final_config_file)
-        print(f'\t - INFO: Configuration created. Saving to {final_config_file}')
+        log.info(f'Configuration created. Saving to {final_config_file}')
+
+        upload_jobs.append((device, {'configuration_file': final_config_file,
+                                     'backup_dir': backup_dir,
+                                     'backup_file': backup_file}))
 
-        print(f'\t - INFO: Uploading configuration to {device["ip_address"]}')
-        # Split the backup path to the directory and the filename
-        backup_path = os.path.split(backup_path)
-        res = subprocess.run(['ansible-playbook', 'playbooks/set_config.yaml',
-                              '-e', f"configuration_file={final_config_file} "
-                                    f"backup_dir={backup_path[0]} backup_file={backup_path[1]}",
-                              '--limit', device['name'], '-i', inventory_file], env=d)
+    # Upload the configuration to all approved devices in parallel
+    log.info(f'Uploading configuration to {len(upload_jobs)} devices')
+    upload_results = run_playbooks(f'{playbooks_dir}/set_config.yaml', upload_jobs, inventory_file, d)
 
-        print(f'\t - INFO: Configuration uploaded successfully')
+    for (device, _), rc in zip(upload_jobs, upload_results):
+        if rc != 0:
+            log.error(f'Uploading configuration to {device["ip_address"]} failed')
+        else:
+            log.info(f'Configuration uploaded successfully to {device["ip_address"]}')
 
 
 if __name__ == '__main__':
@@ -1,10 +1,29 @@
-import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+
+from lxml import etree as ET
 from ruamel.yaml import YAML
 from ruamel.yaml.comments import CommentedMap
 
 yaml = YAML()
 yaml.indent(mapping=2, sequence=4, offset=2)
 
+ROADM_NAMESPACE = 'http://czechlight.cesnet.cz/yang/czechlight-roadm-device'
+ROADM_NSMAP = {None: ROADM_NAMESPACE}
+
+
+@dataclass(slots=True)
+class PlanEntry:
+    """A channel of the channel plan loaded from the device.
+
+    :param name: The name of the channel.
+    :param lower_frequency: The lower frequency of the channel in MHz.
+    :param upper_frequency: The upper frequency of the channel in MHz.
+    """
+
+    name: str
+    lower_frequency: float
+    upper_frequency: float
+
 
 class Channel:
     """A class representing a media channel in the ROADM device. The class can be initialized from either a YAML file or
@@ -14,12 +33,18 @@ class Channel:
     The class provides methods for comparing two channels, creating a new XML child element and creating a new
     CommentedMap object for the YAML representation of the channel.
 
-    :param channel: The channel configuration in the form of a dictionary.
-    :param channel_plan: The channel plan in the form of a dictionary.
+    :param channel: The channel configuration in the form of a dictionary (YAML) or a <media-channels> element (XML).
+    :param plan_by_name: The channel plan indexed by the channel name, see :meth:`index_channel_plan`.
+    :param plan_by_frequency: The channel plan indexed by the frequency key, see :meth:`index_channel_plan`.
     :param origin: The origin of the channel configuration. Either "yaml" or "xml".
     """
 
-    def __init__(self, channel: dict, channel_plan: dict, origin: str = 'yaml'):
+    __slots__ = ('origin', 'center_exp', 'span_exp', 'name', 'port', 'attenuation', 'attenuation_str', 'description',
+                 'frequency_span', 'frequency_center', 'lower_frequency', 'upper_frequency', 'plan_by_name',
+                 'plan_by_frequency', '_key', '_map')
+
+    def __init__(self, channel: dict | ET._Element, plan_by_name: dict[str, PlanEntry],
+                 plan_by_frequency: dict[tuple[int, int], PlanEntry], origin: str = 'yaml'):
 
         assert origin in ['yaml', 'xml'], 'Invalid origin. Please use either "yaml" or "xml".'
         self.origin = origin
@@ -30,18 +55,51 @@ class Channel:
         self.name = None
         self.port = None
         self.attenuation = None
+        self.attenuation_str = None
         self.description = None
         self.frequency_span = None
         self.frequency_center = None
         self.lower_frequency = None
         self.upper_frequency = None
 
-        self.channel_plan = None
+        self.plan_by_name = plan_by_name
+        self.plan_by_frequency = plan_by_frequency
 
         if self.origin == 'yaml':
-            self._init_from_yaml(channel, channel_plan)
+            self._init_from_yaml(channel)
         elif self.origin == 'xml':
-            self._init_from_xml(channel, channel_plan)
+            self._init_from_xml(channel)
+
+        # The key used for comparison and hashing of the channel
+        self._key = (self.name, self.port, self.attenuation, self.lower_frequency, self.upper_frequency)
+
+        # The YAML representation of the channel, created lazily by to_map()
+        self._map = None
+
+    @staticmethod
+    def frequency_key(lower_frequency: float, upper_frequency: float) -> tuple[int, int]:
+        """Create the key for the lookup of the channel by its frequencies. The frequencies are rounded to whole MHz,
+        so that the lookup is not affected by the floating point errors of the frequency calculation.
+
+        :param lower_frequency: The lower frequency of the channel in MHz.
+        :param upper_frequency: The upper frequency of the channel in MHz.
+        """
+
+        return round(lower_frequency), round(upper_frequency)
+
+    @staticmethod
+    def index_channel_plan(channel_plan: list[PlanEntry]) \
+            -> tuple[dict[str, PlanEntry], dict[tuple[int, int], PlanEntry]]:
+        """Index the channel plan by the channel name and by the channel frequencies.
+
+        :param channel_plan: The list of the channel plan entries.
+        :return: A tuple of the channel plan indexed by the name and the channel plan indexed by the frequency key.
+        """
+
+        plan_by_name = {entry.name: entry for entry in channel_plan}
+        plan_by_frequency = {Channel.frequency_key(entry.lower_frequency, entry.upper_frequency): entry
+                             for entry in plan_by_name.values()}
+        return plan_by_name, plan_by_frequency
 
     def create_xml_child(self, parent) -> None:
         """Create the XML child element for the channel.
@@ -50,37 +108,34 @@ class Channel:
         :param parent: The parent XML element.
         """
 
-        media_channels = ET.SubElement(parent, "media-channels")
-        media_channels.set("xmlns", "http://czechlight.cesnet.cz/yang/czechlight-roadm-device")
+        ns = f'{{{ROADM_NAMESPACE}}}'
+        media_channels = ET.SubElement(parent, f'{ns}media-channels', nsmap=ROADM_NSMAP)
 
         # Add the channel name
-        channel = ET.SubElement(media_channels, "channel")
-        channel.text = self.name
-
-        # Add the ADD port and attenuation
-        add = ET.SubElement(media_channels, "add")
-        add_port = ET.SubElement(add, "port")
-        add_port.text = self.port
-        add_attenuation = ET.SubElement(add, "attenuation")
-        add_attenuation.text = str(self.attenuation)
-
-        # Add the DROP port and attenuation
-        drop = ET.SubElement(media_channels, "drop")
-        drop_port = ET.SubElement(drop, "port")
-        drop_port.text = self.port
-        drop_attenuation = ET.SubElement(drop, "attenuation")
-        drop_attenuation.text = str(self.attenuation)
+        ET.SubElement(media_channels, f'{ns}channel').text = self.name
+
+        # Add the ADD and DROP port and attenuation, both blocks are identical
+        def port_block(tag: str) -> None:
+            block = ET.SubElement(media_channels, f'{ns}{tag}')
+            ET.SubElement(block, f'{ns}port').text = self.port
+            ET.SubElement(block, f'{ns}attenuation').text = self.attenuation_str
+
+        port_block('add')
+        port_block('drop')
 
         # Add the description
         if self.description is not None:
-            description = ET.SubElement(media_channels, "description")
-            description.text = self.description
+            ET.SubElement(media_channels, f'{ns}description').text = self.description
 
     def to_map(self) -> CommentedMap:
         """Create a CommentedMap object for the YAML representation of the channel.
-        Used for visualization of the channel configuration.
+        Used for visualization of the channel configuration. The map is created only once and reused by the following
+        calls, so it must not be modified.
         """
 
+        if self._map is not None:
+            return self._map
+
         ret = CommentedMap()
         ret['name'] = self.name
         ret['leaf_port'] = self.port
@@ -91,17 +146,16 @@ class Channel:
 
         ret.yaml_add_eol_comment('GHz', 'frequency_span')
         ret.yaml_add_eol_comment('THz', 'frequency_center')
+        self._map = ret
         return ret
 
-    def _init_from_yaml(self, channel: dict, channel_plan: dict):
+    def _init_from_yaml(self, channel: dict):
         """Initialize the channel dictionary loaded from a YAML file.
 
         :param channel: The channel configuration in the form of a dictionary.
-        :param channel_plan: The channel plan in the form of a dictionary.
         """
 
         self.origin = 'yaml'
-        self.channel_plan = channel_plan
 
         assert 'leaf_port' in channel, 'Leaf port is missing.'
         assert 'attenuation' in channel, 'Attenuation is missing.'
@@ -110,6 +164,7 @@ class Channel:
 
         self.port = channel['leaf_port']
         self.attenuation = channel['attenuation']
+        self.attenuation_str = str(self.attenuation)
         self.frequency_span = channel['frequency_span']
         self.frequency_center = channel['frequency_center']
         self.description = channel['description'] if 'description' in channel else None
@@ -118,30 +173,32 @@ class Channel:
             raise ValueError(f'Channel with frequency center {self.frequency_center} and span '
                              f'{self.frequency_span} not found in the channel plan.')
 
-    def _init_from_xml(self, channel: dict, channel_plan: dict):
-        """Initialize the channel dictionary loaded from an XML file.
+    def _init_from_xml(self, channel: ET._Element):
+        """Initialize the channel from the <media-channels> element loaded from an XML file.
 
-        :param channel: The channel configuration in the form of a dictionary.
-        :param channel_plan: The channel plan in the form of a dictionary.
+        :param channel: The <media-channels> element.
         """
 
         self.origin = 'xml'
-        self.name = channel['channel']
-        self.channel_plan = channel_plan
+        self.name = channel.findtext('{*}channel')
 
         if self.name != 'C-band':
-            assert 'add' in channel, 'ADD port is missing.'
-            assert 'drop' in channel, 'DROP port is missing.'
-            assert 'attenuation' in channel['add'] and 'attenuation' in channel['drop'], \
-                'Attenuation is missing.'
-            assert 'port' in channel['add'] and 'port' in channel['drop'], 'Port is missing.'
-            assert channel['add']['port'] == channel['drop']['port'], 'ADD and DROP ports are not the same.'
-            assert channel['add']['attenuation'] == channel['drop']['attenuation'], \
-                'ADD and DROP attenuation are not the same.'
-
-            self.port = channel['add']['port']
-            self.attenuation = float(channel['add']['attenuation'])
-            self.description = channel['description'] if 'description' in channel else None
+            add = channel.find('{*}add')
+            drop = channel.find('{*}drop')
+            assert add is not None, 'ADD port is missing.'
+            assert drop is not None, 'DROP port is missing.'
+
+            add_port, add_attenuation = add.findtext('{*}port'), add.findtext('{*}attenuation')
+            drop_port, drop_attenuation = drop.findtext('{*}port'), drop.findtext('{*}attenuation')
+            assert add_attenuation is not None and drop_attenuation is not None, 'Attenuation is missing.'
+            assert add_port is not None and drop_port is not None, 'Port is missing.'
+            assert add_port == drop_port, 'ADD and DROP ports are not the same.'
+            assert add_attenuation == drop_attenuation, 'ADD and DROP attenuation are not the same.'
+
+            self.port = add_port
+            self.attenuation = float(add_attenuation)
+            self.attenuation_str = add_attenuation
+            self.description = channel.findtext('{*}description') or None
 
         if not self._find_channel():
             raise ValueError(f'Channel {self.name} not found in the channel plan.')
@@ -151,30 +208,29 @@ class Channel:
         Return True if the channel was found, False otherwise.
         """
 
-        for channel in self.channel_plan['data']['channel-plan']['channel']:
-            name = channel['name']
-            lower_frequency = float(channel['lower-frequency'])
-            upper_frequency = float(channel['upper-frequency'])
+        if self.frequency_center is not None and self.frequency_span is not None:
+            channel_lf = self.frequency_center * self.center_exp - self.frequency_span * self.span_exp / 2
+            channel_uf = self.frequency_center * self.center_exp + self.frequency_span * self.span_exp / 2
+            entry = self.plan_by_frequency.get(self.frequency_key(channel_lf, channel_uf))
+            if entry is None:
+                return False
 
-            if self.frequency_center is not None and self.frequency_span is not None:
-                channel_lf = self.frequency_center * self.center_exp - self.frequency_span * self.span_exp / 2
-                channel_uf = self.frequency_center * self.center_exp + self.frequency_span * self.span_exp / 2
-                if channel_lf == lower_frequency and channel_uf == upper_frequency:
-                    self.name = name
-                    self.lower_frequency = lower_frequency
-                    self.upper_frequency = upper_frequency
-                    return True
+            self.name = entry.name
+            self.lower_frequency = entry.lower_frequency
+            self.upper_frequency = entry.upper_frequency
+            return True
 
-            elif self.name is not None and name == self.name:
-                self.lower_frequency = lower_frequency
-                self.upper_frequency = upper_frequency
+        elif self.name is not None and self.name in self.plan_by_name:
+            entry = self.plan_by_name[self.name]
+            self.lower_frequency = entry.lower_frequency
+            self.upper_frequency = entry.upper_frequency
 
-                frequency_span = self.upper_frequency - self.lower_frequency
-                frequency_center = self.lower_frequency + frequency_span / 2
+            frequency_span = self.upper_frequency - self.lower_frequency
+            frequency_center = self.lower_frequency + frequency_span / 2
 
-                self.frequency_span = frequency_span / self.span_exp
-                self.frequency_center = frequency_center / self.center_exp
-                return True
+            self.frequency_span = frequency_span / self.span_exp
+            self.frequency_center = frequency_center / self.center_exp
+            return True
 
         return False
 
@@ -198,8 +254,13 @@ class Channel:
         if self.name == 'C-band':
             return self.name == other.name
         else:
-            return self.name == other.name and self.port == other.port and self.attenuation == other.attenuation and \
-                self.lower_frequency == other.lower_frequency and self.upper_frequency == other.upper_frequency
+            return self._key == other._key
+
+    def __hash__(self):
+        if self.name == 'C-band':
+            return hash(self.name)
+        else:
+            return hash(self._key)
 
     def __ge__(self, other):
         return self.name >= other.name
@@ -1,15 +1,24 @@
 import os
+import hashlib
+from typing import Iterator
 
-import xmltodict
-import xml.etree.ElementTree as ET
+from lxml import etree
 from ruamel.yaml import YAML
-from ruamel.yaml.comments import CommentedMap, CommentedSeq
+from ruamel.yaml.comments import CommentedMap
 
-from .channel import Channel
+from .channel import Channel, PlanEntry
+
+NETCONF_NAMESPACE = 'urn:ietf:params:xml:ns:netconf:base:1.0'
 
 yaml = YAML()
 yaml.indent(mapping=2, sequence=4, offset=2)
 
+# The proposed configuration is only read, so the faster C-based loader can be used
+safe_yaml = YAML(typ='safe', pure=False)
+
+# Parsed and indexed channel plans shared by the devices, keyed by the MD5 hash of the channel plan file
+_channel_plan_cache: dict[str, tuple[list[PlanEntry], dict[str, PlanEntry], dict[tuple[int, int], PlanEntry]]] = {}
+
 
 class CzechLightROADMConfig:
     """A class representing the configuration of the ROADM device. The class provides methods for loading, comparing and
@@ -38,19 +47,23 @@ class CzechLightROADMConfig:
             raise FileNotFoundError(f'The file {proposed_config_file} does not exist.')
 
         # Load the channel plan and configuration files
-        self.channel_plan = xmltodict.parse(open(channel_plan_file, 'r').read())
-        self.current_channel_config = xmltodict.parse(open(current_config_file, 'r').read())
-        self.proposed_channel_config = yaml.load(open(proposed_config_file, 'r').read())
+        self.channel_plan, self.plan_by_name, self.plan_by_frequency = self._load_channel_plan(channel_plan_file)
+        with open(current_config_file, 'rb') as f:
+            self.current_channel_config = etree.parse(f).getroot()
+        with open(proposed_config_file, 'rb') as f:
+            self.proposed_channel_config = safe_yaml.load(f)
 
         # Create the list of current channels
         self.current_channels = []
-        for channel in self.current_channel_config['data']['media-channels']:
-            self.current_channels.append(Channel(channel=channel, channel_plan=self.channel_plan, origin='xml'))
+        for channel in self.current_channel_config.iterfind('{*}media-channels'):
+            self.current_channels.append(Channel(channel=channel, plan_by_name=self.plan_by_name,
+                                                 plan_by_frequency=self.plan_by_frequency, origin='xml'))
 
         # Create the list of proposed channels
         self.proposed_channels = []
         for channel in self.proposed_channel_config:
-            self.proposed_channels.append(Channel(channel=channel, channel_plan=self.channel_plan, origin='yaml'))
+            self.proposed_channels.append(Channel(channel=channel, plan_by_name=self.plan_by_name,
+                                                  plan_by_frequency=self.plan_by_frequency, origin='yaml'))
 
         # Create the list of new, removed and changed channels
         self.added_channels, self.removed_channels, self.changed_channels, \
@@ -62,29 +75,61 @@ class CzechLightROADMConfig:
         elif self.mode == 'replace':
             self.final_channels = self.proposed_channels
 
+    @staticmethod
+    def _load_channel_plan(channel_plan_file: str) -> tuple[list[PlanEntry], dict[str, PlanEntry],
+                                                            dict[tuple[int, int], PlanEntry]]:
+        """Load and index the channel plan. Devices usually share the same channel plan, so the result is cached by
+        the hash of the file content and the plan is parsed only once.
+
+        :param channel_plan_file: The path to the channel plan file.
+        :return: A tuple of the channel plan, the channel plan indexed by the name and the channel plan indexed by the
+                 frequency key, see :meth:`Channel.index_channel_plan`.
+        """
+
+        # Hash the file in chunks, so that the whole document is not read into the memory
+        md5 = hashlib.md5(usedforsecurity=False)
+        with open(channel_plan_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                md5.update(chunk)
+
+        digest = md5.hexdigest()
+        if digest not in _channel_plan_cache:
+            channel_plan = list(CzechLightROADMConfig._iter_channel_plan(channel_plan_file))
+            _channel_plan_cache[digest] = (channel_plan, *Channel.index_channel_plan(channel_plan))
+        return _channel_plan_cache[digest]
+
+    @staticmethod
+    def _iter_channel_plan(channel_plan_file: str) -> Iterator[PlanEntry]:
+        """Iterate over the channels of the channel plan XML file. The file is parsed incrementally and each parsed
+        channel is removed from the tree right away, so the whole document is never held in the memory.
+
+        :param channel_plan_file: The path to the channel plan file.
+        :return: An iterator of the channel plan entries.
+        """
+
+        for _, channel in etree.iterparse(channel_plan_file, events=('end',), tag='{*}channel'):
+            yield PlanEntry(channel.findtext('{*}name'),
+                            float(channel.findtext('{*}lower-frequency')),
+                            float(channel.findtext('{*}upper-frequency')))
+
+            channel.clear()
+            while channel.getprevious() is not None:
+                del channel.getparent()[0]
+
     def _calculate_statistics(self) -> tuple[list[Channel], list[Channel], list[dict[str, Channel]], list[Channel]]:
         """Create a statistics of the proposed configuration compared to the current configuration.
 
         :return: A tuple of lists containing the added channels, removed channels, changed channels and merged channels.
         """
 
-        added_channels, removed_channels, changed_channels, merged_channels = [], [], [], []
-
-        for current_channel in self.current_channels:
-            for proposed_channel in self.proposed_channels:
-                if current_channel.name == proposed_channel.name:
-                    if current_channel != proposed_channel:
-                        changed_channels.append({'proposed': proposed_channel, 'current': current_channel})
-                    break
-            else:
-                removed_channels.append(current_channel)
+        current_channels = {channel.name: channel for channel in self.current_channels}
+        proposed_channels = {channel.name: channel for channel in self.proposed_channels}
 
-        for proposed_channel in self.proposed_channels:
-            for current_channel in self.current_channels:
-                if current_channel.name == proposed_channel.name:
-                    break
-            else:
-                added_channels.append(proposed_channel)
+        added_channels = [channel for name, channel in proposed_channels.items() if name not in current_channels]
+        removed_channels = [channel for name, channel in current_channels.items() if name not in proposed_channels]
+        changed_channels = [{'proposed': proposed_channels[name], 'current': current_channels[name]}
+                            for name in current_channels.keys() & proposed_channels.keys()
+                            if current_channels[name] != proposed_channels[name]]
 
         # Create the list of merged channels (proposed channels + removed channels)
         merged_channels = self.proposed_channels + removed_channels
@@ -103,13 +148,12 @@ class CzechLightROADMConfig:
         :param output_file: The path to the output file.
         """
 
-        root = ET.Element("config")
-        root.set("xmlns", "urn:ietf:params:xml:ns:netconf:base:1.0")
+        root = etree.Element(f'{{{NETCONF_NAMESPACE}}}config', nsmap={None: NETCONF_NAMESPACE})
 
         for channel in self.final_channels:
             channel.create_xml_child(root)
 
-        tree = ET.ElementTree(root)
+        tree = etree.ElementTree(root)
         tree.write(output_file, encoding='utf-8')
 
     def create_summary(self, output_dir: str):
@@ -149,11 +193,12 @@ class CzechLightROADMConfig:
         proposed_channel_dict = proposed_channel.to_map()
         current_channel_dict = current_channel.to_map()
 
-        for key in proposed_channel_dict:
-            if proposed_channel_dict[key] != current_channel_dict[key]:
-                change[key] = f'{current_channel_dict[key]} -> {proposed_channel_dict[key]}'
+        for key, proposed_value in proposed_channel_dict.items():
+            current_value = current_channel_dict[key]
+            if proposed_value != current_value:
+                change[key] = f'{current_value} -> {proposed_value}'
             else:
-                change[key] = proposed_channel_dict[key]
+                change[key] = proposed_value
 
         change.yaml_add_eol_comment('GHz', 'frequency_span')
         change.yaml_add_eol_comment('THz', 'frequency_center')
@@ -168,13 +213,13 @@ class CzechLightROADMConfig:
         :param output_file: The path to the output file.
         """
 
-        n_channels = len(channels)
         with open(output_file, 'w') as f:
-            commented_channels = CommentedSeq(channels)
-            for i in range(n_channels):
-                commented_channels.yaml_set_comment_before_after_key(i, before='\n')
-
-            if n_channels == 0:
+            if not channels:
                 yaml.dump('No channels in this category', f)
-            else:
-                yaml.dump(commented_channels, f)
+                return
+
+            # Dump the channels one by one separated by an empty line instead of attaching the empty line
+            # as a comment to every item of the sequence
+            for channel in channels:
+                f.write('\n')
+                yaml.dump([channel], f)
@@ -1,25 +1,22 @@
-from ruamel.yaml import YAML
-from ruamel.yaml.comments import CommentedMap
-
-yaml = YAML()
-yaml.indent(mapping=2, sequence=4, offset=2)
+import json
 
 
 def create_inventory(devices_configuration: list, output_path: str) -> None:
     """Creates an Ansible inventory file from the list of devices.
+    The values are written as JSON strings, which are valid YAML scalars, so that special characters in the
+    passwords or names do not break the inventory.
 
     :param devices_configuration: The list of devices.
     :param output_path: The path to the output file.
     """
-    
-    inventory = CommentedMap()
-    inventory['all'] = CommentedMap()
-    inventory['all']['hosts'] = CommentedMap()
+
+    lines = ['all:\n  hosts:\n']
 
     for device in devices_configuration:
-        inventory['all']['hosts'][device['name']] = CommentedMap()
-        inventory['all']['hosts'][device['name']]['ansible_host'] = device['ip_address']
-        inventory['all']['hosts'][device['name']]['ansible_user'] = device['username']
-        inventory['all']['hosts'][device['name']]['ansible_password'] = device['password']
+        lines.append(f"    {json.dumps(str(device['name']))}:\n"
+                     f"      ansible_host: {json.dumps(str(device['ip_address']))}\n"
+                     f"      ansible_user: {json.dumps(str(device['username']))}\n"
+                     f"      ansible_password: {json.dumps(str(device['password']))}\n")
 
-    yaml.dump(inventory, open(output_path, 'w'))
+    with open(output_path, 'w') as f:
+        f.writelines(lines)